@@ -4,8 +4,9 @@ Each device is an instance of either `Mouse`, `Keyboard` or `HID` (experimental)
 
 Use `hook_raw_input_for_window` to receive raw input events.
 Each event also references the `RawInputDevice` that triggered it.
+Without a window of your own, pass `hwnd=None` and call `pump_messages` on the same thread.
 """
-from ._api import hook_raw_input_for_window, RawInputDevice, Mouse, Keyboard, HID, RawInputEvent, list_devices
+from ._api import hook_raw_input_for_window, pump_messages, RawInputDevice, Mouse, Keyboard, HID, RawInputEvent, list_devices
 
 
 __all__ = [key for key in globals().keys() if not key.startswith('_')]
@@ -7,7 +7,7 @@ from ._win_raw_input import *
 from ._usb_ids import lookup_product
 
 
-@dataclass
+@dataclass(eq=False)
 class RawInputDevice:
     """
     Base class for input devices.
@@ -21,6 +21,8 @@ class RawInputDevice:
     Some devices cannot be identified, e.g. events caused by software.
     Then the devices stores an invalid handle and has `path=None`.
     """
+    # Slots are declared by hand because dataclass(slots=True) requires Python 3.10.
+    __slots__ = ('handle', 'path', 'vendor_id', 'vendor_name', 'product_id', 'product_name', 'interface_name')
 
     handle: int
     """Windows handle for the device. This is valid only in the current session. For a unique identifier, use `path`."""
@@ -45,7 +47,7 @@ class RawInputDevice:
         return is_connected(self.handle)
 
 
-@dataclass
+@dataclass(eq=False)
 class Keyboard(RawInputDevice):
     """
     Keyboards send events when a key is pressed, released or while a key is being held.
@@ -55,6 +57,8 @@ class Keyboard(RawInputDevice):
 
     This class inherits the method `RawInputDevice.is_connected()`.
     """
+    __slots__ = ('keyboard_type', 'subtype', 'scan_code_mode', 'num_function_keys', 'num_indicators', 'num_keys')
+
     keyboard_type: str
     subtype: int
     scan_code_mode: int
@@ -69,7 +73,7 @@ class Keyboard(RawInputDevice):
         return isinstance(other, Keyboard) and other.handle == self.handle
 
 
-@dataclass
+@dataclass(eq=False)
 class Mouse(RawInputDevice):
     """
     Mice can send the following event types:
@@ -82,9 +86,12 @@ class Mouse(RawInputDevice):
 
     In case of `move` events, `RawInputEvent.delta_x` and `RawInputEvent.delta_y` hold the amount by which the mouse moved.
     For button events, `code` denotes the button index and `name` stores the human-readable button name.
+    If the mouse reports multiple button changes at once, one event is sent for each.
 
     This class inherits the method `RawInputDevice.is_connected()`.
     """
+    __slots__ = ('mouse_type', 'num_buttons', 'sample_rate', 'has_horizontal_wheel')
+
     mouse_type: str
     """HID mouse, HID wheel mouse, Mouse with horizontal wheel, unknown"""
     num_buttons: int
@@ -99,15 +106,18 @@ class Mouse(RawInputDevice):
         return isinstance(other, Mouse) and other.handle == self.handle
 
 
-@dataclass
+@dataclass(eq=False)
 class HID(RawInputDevice):
     """
     HID devices that are neither classified as keyboard nor mouse.
-    These devices send raw data as bytes, stored in `RawInputEvent.data`.
+    These devices send raw data, passed as a `memoryview` in `RawInputEvent.data`.
+    It is only valid inside the callback, use `bytes(event.data)` to keep it.
     All input events are classified as `event_type='data'`.
 
     This class inherits the method `RawInputDevice.is_connected()`.
     """
+    __slots__ = ('version_number', 'usage_page', 'usage_page_name', 'usage', 'usage_name')
+
     version_number: int
     usage_page: int
     usage_page_name: str
@@ -122,6 +132,8 @@ class HID(RawInputDevice):
 
 
 CACHED_DEVICES = {}  # handle -> RawInputDevice
+_HID_EVENT_NAMES = {}  # (count, size_hid) -> RawInputEvent.name for HID reports
+_HOOKS_BY_THREAD = {}  # thread id -> [(hwnd, batched)] of the installed hooks, destroyed windows are dropped on the next install
 
 
 def list_devices() -> Sequence[RawInputDevice]:
@@ -130,19 +142,57 @@ def list_devices() -> Sequence[RawInputDevice]:
     For each device, this function also looks up its unique name and additional information.
 
     All discovered devices are cached by their `handle` which is unique during this session.
+    Devices that are already cached are reused, devices that are no longer listed are removed from the cache.
 
     Returns:
         Devices as sequence of `RawInputDevice`
     """
     devices = [get_device(dev.dwType, dev.hDevice) for dev in get_raw_input_device_list()]
-    CACHED_DEVICES.clear()
-    CACHED_DEVICES.update({d.handle: d for d in devices})
+    live_handles = {d.handle for d in devices}
+    for handle in [h for h in CACHED_DEVICES if h not in live_handles]:
+        del CACHED_DEVICES[handle]
     return devices
 
 
+def _create_mouse(handle, path, info, vendor_id, product_id, interface_name) -> Mouse:
+    mouse_type = MOUSE_TYPES.get(info.u.mouse.dwId, 'unknown')
+    num_buttons = info.u.mouse.dwNumberOfButtons
+    sample_rate = info.u.mouse.dwSampleRate or None
+    has_horizontal_wheel = bool(info.u.mouse.fHasHorizontalWheel)
+    vendor_name, product_name = lookup_product(vendor_id, product_id)
+    return Mouse(handle, path, vendor_id, vendor_name, product_id, product_name, interface_name, mouse_type, num_buttons, sample_rate, has_horizontal_wheel)
+
+
+def _create_keyboard(handle, path, info, vendor_id, product_id, interface_name) -> Keyboard:
+    kb_type = KEYBOARD_TYPES.get(info.u.keyboard.dwType, 'unknown')
+    subtype = info.u.keyboard.dwSubType
+    scan_code_mode = info.u.keyboard.dwKeyboardMode
+    num_function_keys = info.u.keyboard.dwNumberOfFunctionKeys
+    num_indicators = info.u.keyboard.dwNumberOfIndicators
+    num_keys = info.u.keyboard.dwNumberOfKeysTotal
+    vendor_name, product_name = lookup_product(vendor_id, product_id)
+    return Keyboard(handle, path, vendor_id, vendor_name, product_id, product_name, interface_name, kb_type, subtype, scan_code_mode, num_function_keys, num_indicators, num_keys)
+
+
+def _create_hid(handle, path, info, vendor_id, product_id, interface_name) -> HID:
+    vendor_id = info.u.hid.dwVendorId
+    product_id = info.u.hid.dwProductId
+    version_number = info.u.hid.dwVersionNumber
+    usage_page = info.u.hid.usUsagePage
+    usage_page_name, page_entries = USAGE_PAGE_NAMES.get(usage_page, ('unknown', {}))
+    usage = info.u.hid.usUsage
+    usage_name = page_entries.get(usage, 'unknown')
+    vendor_name, product_name = lookup_product(vendor_id, product_id)
+    return HID(handle, path, vendor_id, vendor_name, product_id, product_name, interface_name, version_number, usage_page, usage_page_name, usage, usage_name)
+
+
+_DEVICE_CONSTRUCTORS = (_create_mouse, _create_keyboard, _create_hid)  # indexed by dwType
+
+
 def get_device(dw_type: int, handle: int) -> RawInputDevice:
-    if handle in CACHED_DEVICES:
-        return CACHED_DEVICES[handle]
+    device = CACHED_DEVICES.get(handle)  # cached devices are never None
+    if device is not None:
+        return device
     path = get_device_path(handle)
     info = get_device_info(handle)
     dw_type = info.dwType if handle else dw_type
@@ -155,43 +205,23 @@ def get_device(dw_type: int, handle: int) -> RawInputDevice:
         vendor_id = None
         product_id = None
         interface_name = None
-    if dw_type == 0:
-        mouse_type = MOUSE_TYPES.get(info.u.mouse.dwId, 'unknown')
-        num_buttons = info.u.mouse.dwNumberOfButtons
-        sample_rate = info.u.mouse.dwSampleRate or None
-        has_horizontal_wheel = bool(info.u.mouse.fHasHorizontalWheel)
-        vendor_name, product_name = lookup_product(vendor_id, product_id)
-        device = Mouse(handle, path, vendor_id, vendor_name, product_id, product_name, interface_name, mouse_type, num_buttons, sample_rate, has_horizontal_wheel)
-    elif dw_type == 1:
-        kb_type = KEYBOARD_TYPES.get(info.u.keyboard.dwType, 'unknown')
-        subtype = info.u.keyboard.dwSubType
-        scan_code_mode = info.u.keyboard.dwKeyboardMode
-        num_function_keys = info.u.keyboard.dwNumberOfFunctionKeys
-        num_indicators = info.u.keyboard.dwNumberOfIndicators
-        num_keys = info.u.keyboard.dwNumberOfKeysTotal
-        vendor_name, product_name = lookup_product(vendor_id, product_id)
-        device = Keyboard(handle, path, vendor_id, vendor_name, product_id, product_name, interface_name, kb_type, subtype, scan_code_mode, num_function_keys, num_indicators, num_keys)
-    elif dw_type == 2:
-        vendor_id = info.u.hid.dwVendorId
-        product_id = info.u.hid.dwProductId
-        version_number = info.u.hid.dwVersionNumber
-        usage_page = info.u.hid.usUsagePage
-        usage_page_name, page_entries = USAGE_PAGE_NAMES.get(usage_page, ('unknown', {}))
-        usage = info.u.hid.usUsage
-        usage_name = page_entries.get(usage, 'unknown')
-        vendor_name, product_name = lookup_product(vendor_id, product_id)
-        device = HID(handle, path, vendor_id, vendor_name, product_id, product_name, interface_name, version_number, usage_page, usage_page_name, usage, usage_name)
-    else:
+    try:
+        create_device = _DEVICE_CONSTRUCTORS[dw_type]
+    except IndexError:
         raise NotImplementedError(f"Unknown device type: {dw_type}")
+    device = create_device(handle, path, info, vendor_id, product_id, interface_name)
     CACHED_DEVICES[handle] = device
     return device
 
 
-@dataclass
+@dataclass(eq=False)
 class RawInputEvent:
     """
     These events are sent to the callback registered via `hook_raw_input_for_window()`.
     """
+    # One event is created per WM_INPUT message. Slots avoid allocating an instance dict for each one.
+    __slots__ = ('event_type', 'code', 'name', 'device_type', 'device', 'delta_x', 'delta_y', 'hwnd', 'time', 'data', 'raw')
+
     event_type: str
     """'up'/'down' for buttons, 'move' for mouse, 'data' for HID"""
     code: int
@@ -210,15 +240,19 @@ class RawInputEvent:
     """Window handle of the window this event was sent to"""
     time: float
     """Time of the event measured vis `time.perf_counter()`"""
-    data: Optional[bytes]
-    """Raw data sent by HID devices"""
+    data: Optional[memoryview]
+    """Raw data sent by HID devices.
+    The memory is reused for subsequent events and only valid inside the callback. Use `bytes(event.data)` to keep it."""
     raw: RAWINPUT
-    """Raw event data sent from Windows"""
+    """Raw event data sent from Windows.
+    The structure is reused for subsequent events and only valid inside the callback. Use `RAWINPUT.from_buffer_copy()` to keep it."""
 
 
 def hook_raw_input_for_window(hwnd,
                               callback: Callable[[RawInputEvent], None],
-                              device_types=('Pointer', 'Mouse', 'Joystick', 'Game Pad', 'Keyboard', 'Keypad', 'Multi-axis Controller')):
+                              device_types=('Pointer', 'Mouse', 'Joystick', 'Game Pad', 'Keyboard', 'Keypad', 'Multi-axis Controller'),
+                              filter_zero_move=True,
+                              batched=False):
     """
     Listen to raw input events sent to a window by the operating system (Windows).
 
@@ -236,57 +270,179 @@ def hook_raw_input_for_window(hwnd,
             * Most functions in win32gui
             * `fig.canvas.manager.window.winId()` in matplotlib using PyQt5
 
-        callback: Function
+            If `None`, an invisible window is created. Its messages are processed by `pump_messages()` on the same thread.
+
+        callback: Function or bound method, called with a single `RawInputEvent` per input.
+            It is called from inside the window procedure, so it should return quickly.
         device_types:
            Types of devices to listen for.
            This defines the usage page and value.
            Supported device types are `'Pointer'`, `'Mouse'`, `'Joystick'`, `'Game Pad'`, `'Keyboard'`, `'Keypad'`, `'Multi-axis Controller'`.
+        filter_zero_move: If `True`, relative `'move'` events with `delta_x == delta_y == 0` are not passed to `callback`.
+            Mice with high polling rates send many of these.
+        batched: If `True`, every `WM_INPUT` message also reads all raw input that is still queued using `GetRawInputBuffer`.
+            This replaces many window messages by one call at high polling rates.
+            Events read together have the same `time`.
+            Their `RawInputEvent.raw` keeps the shared batch buffer alive but is overwritten by later batches, use `RAWINPUT.from_buffer_copy()` to keep it.
+            `GetRawInputBuffer` empties the raw input queue of the whole thread, so this must be the only raw input hook on that thread.
+            Installing it next to another hook of this module on the same thread raises a `ValueError`.
+            Raw input registered by other libraries on the thread is consumed as well, it is passed to `callback` or dropped if not in `device_types`.
+            Not supported for 32-bit Python on 64-bit Windows (WOW64) where the buffered records have the 64-bit layout, raises a `ValueError` there.
     """
-    def process_message(hwnd, msg, wParam, lParam):  # Called by Windows to handle window events.
-        if msg == WM_INPUT:  # raw input. other events don't reference the device
-            event_time = time.perf_counter()
-            dwSize = c_uint()
-            if user32.GetRawInputData(lParam, RID_INPUT, NULL, byref(dwSize), sizeof(RAWINPUTHEADER)):
-                raise ctypes.WinError(GetLastError())
-            raw = RAWINPUT()
-            assert user32.GetRawInputData(lParam, RID_INPUT, byref(raw), byref(dwSize), sizeof(RAWINPUTHEADER)) == dwSize.value
-            device = get_device(raw.header.dwType, raw.header.hDevice)
-            if raw.header.dwType == 1:  # Keyboard
-                if raw.data.mouse.usFlags in MOVE_MODES and raw.data.mouse._s2.usButtonFlags == 0:  # actually caused by mouse
-                    device = get_device(0, raw.header.hDevice)
-                assert dwSize.value == 40
-                message = raw.data.keyboard.message
-                vk_code = raw.data.keyboard.vk_code
-                scan_code = raw.data.keyboard.scan_code
-                # flags = raw.data.keyboard.flags
-                if vk_code in VIRTUAL_KEYBOARD:
-                    key_name, is_keypad = VIRTUAL_KEYBOARD[vk_code]
-                else:
-                    key_name, is_keypad = KEY_NAMES_LOWER[scan_code], False
-                evt_type = KEY_EVENT_TYPE[message]
-                event = RawInputEvent(evt_type, scan_code, key_name, 'keypad' if is_keypad else 'keyboard', device, None, None, hwnd, event_time, None, raw)
-            elif raw.header.dwType == 0:  # Mouse
-                assert dwSize.value == 48
-                button = raw.data.mouse.ulButtons
-                if button == 0:
-                    mode = raw.data.mouse.usFlags
-                    event = RawInputEvent('move', mode, MOVE_MODES.get(mode, 'unknown'), 'mouse', device, raw.data.mouse.lLastX, raw.data.mouse.lLastY, hwnd, event_time, None, raw)
-                else:
-                    evt_type, button_id, button_name = MOUSE_BUTTONS[button]
-                    event = RawInputEvent(evt_type, button_id, button_name, 'mouse', device, None, None, hwnd, event_time, None, raw)
-            elif raw.header.dwType == 2:  # Controller
-                size_hid = raw.data.hid.dwSizeHid  # The size, in bytes, of each HID input in bRawData.
-                count = raw.data.hid.dwCount  # The number of HID inputs in bRawData.
-                raw_data = raw.data.hid.bRawData  # The raw input data, as an array of bytes.
-                raw_data_ptr = ctypes.cast(raw_data, POINTER(BYTE * (size_hid * count)))
-                raw_data_bytes = ctypes.string_at(raw_data_ptr, sizeof(raw_data_ptr.contents))
-                event = RawInputEvent('data', -1, f'{count} x {size_hid} bytes', 'hid', device, None, None, hwnd, event_time, raw_data_bytes, raw)
-            else:
-                raise NotImplementedError
+    # Bind everything that is used per event to the enclosing scope. Closure cells are cheaper than global + attribute lookups.
+    perf_counter = time.perf_counter
+    get_raw_input_data = GetRawInputData
+    header_size = sizeof(RAWINPUTHEADER)
+    copy_memory = memmove
+    address_of = addressof
+    vk_names = VIRTUAL_KEYBOARD_NAMES
+    vk_device_types = VIRTUAL_KEYBOARD_DEVICE_TYPES
+    key_names = KEY_NAMES_LOWER_LIST
+    key_event_types = KEY_EVENT_TYPE_LIST
+    mouse_buttons = MOUSE_BUTTONS_LIST
+    wheel_buttons = MOUSE_BUTTONS
+    decode_buttons = decode_button_flags
+    move_modes = MOVE_MODES
+    move_mode_names = MOVE_MODES_LIST
+    hid_event_names = _HID_EVENT_NAMES
+    unpack_header = RAWINPUTHEADER_STRUCT.unpack_from
+    data_offset = RAWINPUT_DATA_OFFSET
+    unpack_mouse = RAWMOUSE_STRUCT.unpack_from
+    unpack_keyboard = RAWKEYBOARD_STRUCT.unpack_from
+    new_event = RawInputEvent
+    cached_device = CACHED_DEVICES.get
+    # The same buffer receives every message. It is grown if a HID report does not fit.
+    # The byref() arguments are created once and only recreated when the buffer moves.
+    raw = RAWINPUT()
+    raw_ref = byref(raw)
+    raw_capacity = sizeof(raw)
+    raw_size = c_uint()
+    raw_size_ref = byref(raw_size)
+    # HID reports are copied into this buffer and passed to the callback as a memoryview. It is replaced if a report does not fit.
+    hid_buffer = bytearray(1024)
+    hid_view = memoryview(hid_buffer)  # also prevents the bytearray from being resized while its address is in use
+    hid_address = addressof((c_char * len(hid_buffer)).from_buffer(hid_buffer))
+    # Queued records are read into this buffer by GetRawInputBuffer if batched. It is replaced if a record does not fit.
+    get_raw_input_buffer = GetRawInputBuffer
+    raw_input_in = RAWINPUT.from_buffer  # the record keeps the buffer alive, events may outlive a replaced buffer
+    batch_slack = sizeof(RAWINPUT)  # from_buffer() needs a whole RAWINPUT after each record, even a short one at the end
+    batch_capacity = 16384  # bytes Windows may fill, excluding the slack
+    batch_buffer = (c_char * (batch_capacity + batch_slack))() if batched else None
+    batch_size = c_uint()
+    batch_size_ref = byref(batch_size)
+    alignment = sizeof(ctypes.c_void_p)  # records start at pointer-aligned addresses, see NEXTRAWINPUTBLOCK
+
+    def keyboard_event(raw, h_device, device, hwnd, event_time):
+        # Reading all fields at once is faster than going through the ctypes field descriptors
+        scan_code, flags, reserved, vk_code, message, extra_info = unpack_keyboard(raw, data_offset)
+        if scan_code in move_modes and reserved == 0:  # same bytes as RAWMOUSE.usFlags and usButtonFlags, actually caused by mouse
+            device = get_device(0, h_device)
+        key_name = vk_names[vk_code] or key_names[scan_code]
+        evt_type = key_event_types[message - 256] if 256 <= message < 262 else 'unknown'  # WM_KEYDOWN ... WM_SYSKEYUP
+        return new_event(evt_type, scan_code, key_name, vk_device_types[vk_code], device, None, None, hwnd, event_time, None, raw)
+
+    def mouse_event(raw, h_device, device, hwnd, event_time):
+        mode, button, raw_buttons, delta_x, delta_y, extra_info = unpack_mouse(raw, data_offset)
+        if button == 0:
+            if delta_x == 0 and delta_y == 0 and filter_zero_move and not mode & 0x05:  # relative without attribute change
+                return None
+            return new_event('move', mode, move_mode_names[mode] if mode < 0x10 else 'unknown', 'mouse', device, delta_x, delta_y, hwnd, event_time, None, raw)
+        entry = mouse_buttons[button] if button < 0x400 else wheel_buttons.get(button)
+        if entry is not None:  # one button transition or a single wheel notch
+            evt_type, button_id, button_name = entry
+            return new_event(evt_type, button_id, button_name, 'mouse', device, None, None, hwnd, event_time, None, raw)
+        for evt_type, button_id, button_name in decode_buttons(button):  # multiple flags in one message, one event each
+            callback(new_event(evt_type, button_id, button_name, 'mouse', device, None, None, hwnd, event_time, None, raw))
+        return None
+
+    def hid_event(raw, h_device, device, hwnd, event_time):  # Controller
+        nonlocal hid_buffer, hid_view, hid_address
+        hid = raw.data.hid
+        size_hid = hid.dwSizeHid  # The size, in bytes, of each HID input in bRawData.
+        count = hid.dwCount  # The number of HID inputs in bRawData.
+        raw_data = hid.bRawData  # The raw input data, as an array of bytes.
+        nbytes = size_hid * count
+        if nbytes > len(hid_buffer):
+            hid_buffer = bytearray(nbytes)
+            hid_view = memoryview(hid_buffer)
+            hid_address = address_of((c_char * nbytes).from_buffer(hid_buffer))
+        copy_memory(hid_address, address_of(raw_data), nbytes)  # bRawData is declared with length 1, so copy from its address
+        name = hid_event_names.get((count, size_hid))
+        if name is None:  # devices typically send only a few distinct report sizes
+            name = hid_event_names[count, size_hid] = f'{count} x {size_hid} bytes'
+        return new_event('data', -1, name, 'hid', device, None, None, hwnd, event_time, hid_view[:nbytes], raw)
+
+    if isinstance(device_types, str):
+        device_types = (device_types,)
+    # Only handle the raw input types that were requested. Other libraries may register more for the same window.
+    dw_types = {dw_type for device_type in device_types for dw_type in USAGE_NAME_TO_RAW_INPUT_TYPES[device_type.lower()]}
+    event_handlers = tuple(handler if dw_type in dw_types else None for dw_type, handler in enumerate((mouse_event, keyboard_event, hid_event)))  # indexed by dwType
+
+    def dispatch(raw, dw_type, h_device, hwnd, event_time):
+        try:
+            handle_event = event_handlers[dw_type]
+        except IndexError:
+            raise NotImplementedError
+        if handle_event is None:
+            return
+        device = cached_device(h_device)
+        if device is None:
+            device = get_device(dw_type, h_device)
+        event = handle_event(raw, h_device, device, hwnd, event_time)
+        if event is not None:
             callback(event)
+
+    def read_raw_input_buffer(hwnd, event_time):
+        nonlocal batch_buffer, batch_capacity
+        while True:
+            batch_size.value = batch_capacity
+            count = get_raw_input_buffer(batch_buffer, batch_size_ref, header_size)
+            if count == RAW_INPUT_ERROR:  # the next record does not fit, query its size
+                if get_raw_input_buffer(None, batch_size_ref, header_size) == RAW_INPUT_ERROR or batch_size.value <= batch_capacity:
+                    raise ctypes.WinError(GetLastError())
+                batch_capacity = batch_size.value
+                batch_buffer = (c_char * (batch_capacity + batch_slack))()
+                continue
+            if count == 0:
+                return
+            offset = 0
+            for _ in range(count):
+                dw_type, dw_size, h_device = unpack_header(batch_buffer, offset)
+                dispatch(raw_input_in(batch_buffer, offset), dw_type, h_device or None, hwnd, event_time)
+                offset = (offset + dw_size + alignment - 1) & -alignment
+
+    def process_message(hwnd, msg, wParam, lParam):  # Called by the window procedure for WM_INPUT, WM_INPUT_DEVICE_CHANGE and WM_NCDESTROY only
+        nonlocal raw_ref, raw_capacity
+        if msg != WM_INPUT:
+            if msg == WM_INPUT_DEVICE_CHANGE:
+                device_changed(wParam, lParam, hwnd)
+            else:
+                device_window_destroyed(hwnd)
+            return
+        event_time = perf_counter()
+        raw_size.value = raw_capacity  # in: buffer size, Windows may overwrite it
+        if get_raw_input_data(lParam, RID_INPUT, raw_ref, raw_size_ref, header_size) == RAW_INPUT_ERROR:  # buffer too small, query the required size
+            if get_raw_input_data(lParam, RID_INPUT, None, raw_size_ref, header_size):
+                raise ctypes.WinError(GetLastError())
+            ctypes.resize(raw, raw_size.value)
+            raw_ref = byref(raw)  # byref() stores the address, which resize() may have changed
+            raw_capacity = raw_size.value
+            if get_raw_input_data(lParam, RID_INPUT, raw_ref, raw_size_ref, header_size) == RAW_INPUT_ERROR:
+                raise ctypes.WinError(GetLastError())
+        dw_type, dw_size, h_device = unpack_header(raw)  # no RAWINPUTHEADER wrapper object
+        dispatch(raw, dw_type, h_device or None, hwnd, event_time)
+        if batched:
+            read_raw_input_buffer(hwnd, event_time)
+    if batched and is_wow64():
+        raise ValueError("batched=True is not supported for 32-bit Python on 64-bit Windows")
+    thread_id = GetWindowThreadProcessId(hwnd, None) if hwnd else GetCurrentThreadId()  # invisible windows belong to the calling thread
+    thread_hooks = [(other_hwnd, other_batched) for other_hwnd, other_batched in _HOOKS_BY_THREAD.get(thread_id, ()) if IsWindow(other_hwnd)]
+    if thread_hooks and (batched or any(other_batched for _, other_batched in thread_hooks)):
+        raise ValueError("batched=True requires the only raw input hook on its thread because GetRawInputBuffer reads the input of the whole thread")
     if hwnd:
-        set_window_procedure(hwnd, process_message, call_original=True)
+        set_window_procedure(hwnd, process_message, call_original=True, messages=(WM_INPUT, WM_INPUT_DEVICE_CHANGE, WM_NCDESTROY))
     else:
-        hwnd = invisible_window(process_message)
-    for device_type in device_types:
-        enable_raw_input_for_window(hwnd, device_type)
+        hwnd = invisible_window(process_message, messages=(WM_INPUT, WM_INPUT_DEVICE_CHANGE, WM_NCDESTROY))
+    thread_hooks.append((hwnd, batched))
+    _HOOKS_BY_THREAD[thread_id] = thread_hooks
+    enable_raw_input_for_window(hwnd, device_types)
@@ -4,15 +4,19 @@ This is error-prone and can introduce very unpythonic failure modes, such as seg
 But it is also dependency-free, very performant well documented on Microsoft's website and scattered examples.
 """
 import ctypes
-from ctypes import c_short, c_uint8, c_int, c_uint, c_long, Structure, CFUNCTYPE, POINTER, WINFUNCTYPE, byref, sizeof, Union, c_ushort
+import functools
+import struct
+from ctypes import c_short, c_uint8, c_int, c_uint, c_long, Structure, CFUNCTYPE, POINTER, WINFUNCTYPE, byref, sizeof, Union, c_ushort, c_char, addressof, memmove
 from ctypes.wintypes import WORD, DWORD, BOOL, HHOOK, MSG, LPWSTR, WCHAR, WPARAM, LPARAM, LONG, USHORT, HWND, UINT, HANDLE, LPCWSTR, ULONG, BYTE, HMENU, HINSTANCE, LPVOID, INT
-from typing import Callable, Optional
+from typing import Callable, Container, Optional, Sequence
 
 user32 = ctypes.windll.user32
 kernel32 = ctypes.windll.kernel32
+gdi32 = ctypes.windll.gdi32
 
 LPMSG = POINTER(MSG)
-ULONG_PTR = POINTER(DWORD)
+LRESULT = LPARAM  # LONG_PTR
+ULONG_PTR = ctypes.c_size_t
 
 
 class KBDLLHOOKSTRUCT(Structure):  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/ns-winuser-kbdllhookstruct
@@ -74,7 +78,7 @@ class RAWINPUTDEVICELIST(ctypes.Structure):  # https://learn.microsoft.com/en-us
 
 PRAWINPUTDEVICELIST = POINTER(RAWINPUTDEVICELIST)
 
-WNDPROCTYPE = WINFUNCTYPE(c_int, HWND, UINT, WPARAM, LPARAM)
+WNDPROCTYPE = WINFUNCTYPE(LRESULT, HWND, UINT, WPARAM, LPARAM)
 CS_HREDRAW = 2
 CS_VREDRAW = 1
 CW_USEDEFAULT = 0x80000000
@@ -87,7 +91,13 @@ RIM_TYPES = {0: 'mouse', 1: 'keyboard', 2: 'hid'}
 
 RID_INPUT = 0x10000003
 
+RAW_INPUT_ERROR = 0xFFFFFFFF  # (UINT)-1, returned by the GetRawInput* functions on failure
+
 RIDEV_INPUTSINK = 0x00000100
+RIDEV_DEVNOTIFY = 0x00002000  # send WM_INPUT_DEVICE_CHANGE when a device is added or removed
+
+GIDC_ARRIVAL = 1  # wParam of WM_INPUT_DEVICE_CHANGE
+GIDC_REMOVAL = 2
 
 
 class WNDCLASSEX(Structure):  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/ns-winuser-wndclassexa
@@ -172,6 +182,13 @@ class RAWINPUT(Structure):
     ]
 
 
+# Layouts of the RAWINPUT header and payloads (at RAWINPUT_DATA_OFFSET) for reading all fields with one unpack_from() call.
+RAWINPUTHEADER_STRUCT = struct.Struct('@IIP')  # dwType, dwSize, hDevice with native alignment, hDevice is 0 instead of None for NULL
+RAWINPUT_DATA_OFFSET = RAWINPUT.data.offset
+RAWMOUSE_STRUCT = struct.Struct('<H2xIIiiI')  # usFlags, ulButtons, ulRawButtons, lLastX, lLastY, ulExtraInformation
+RAWKEYBOARD_STRUCT = struct.Struct('<HHHHII')  # scan_code, flags, reserved, vk_code, message, dwExtraInfo
+
+
 class RID_DEVICE_INFO_MOUSE(ctypes.Structure):
     _fields_ = [
         ("dwId", DWORD),
@@ -226,15 +243,23 @@ CreateWindowExW = user32.CreateWindowExW
 CreateWindowExW.argtypes = [DWORD, LPCWSTR, LPCWSTR, DWORD, INT, INT, INT, INT, HWND, HMENU, HINSTANCE, LPVOID]
 CreateWindowExW.restype = HWND
 
+RegisterClassExW = user32.RegisterClassExW  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-registerclassexw
+RegisterClassExW.argtypes = [POINTER(WNDCLASSEX)]
+RegisterClassExW.restype = WORD  # ATOM
+
+GetStockObject = gdi32.GetStockObject
+GetStockObject.argtypes = [c_int]
+GetStockObject.restype = HANDLE  # HGDIOBJ
+
 LowLevelKeyboardProc = CFUNCTYPE(c_int, WPARAM, LPARAM, POINTER(KBDLLHOOKSTRUCT))
 
 SetWindowsHookEx = user32.SetWindowsHookExA  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-setwindowshookexa
-# SetWindowsHookEx.argtypes = [c_int, LowLevelKeyboardProc, c_int, c_int]
+SetWindowsHookEx.argtypes = [c_int, LowLevelKeyboardProc, HINSTANCE, DWORD]
 SetWindowsHookEx.restype = HHOOK
 
 CallNextHookEx = user32.CallNextHookEx
-# CallNextHookEx.argtypes = [c_int , c_int, c_int, POINTER(KBDLLHOOKSTRUCT)]
-CallNextHookEx.restype = c_int
+CallNextHookEx.argtypes = [HHOOK, c_int, WPARAM, LPARAM]
+CallNextHookEx.restype = LRESULT
 
 UnhookWindowsHookEx = user32.UnhookWindowsHookEx
 UnhookWindowsHookEx.argtypes = [HHOOK]
@@ -244,6 +269,20 @@ GetMessage = user32.GetMessageW
 GetMessage.argtypes = [LPMSG, c_int, c_int, c_int]
 GetMessage.restype = BOOL
 
+PeekMessage = user32.PeekMessageW  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-peekmessagew
+PeekMessage.argtypes = [LPMSG, HWND, UINT, UINT, UINT]
+PeekMessage.restype = BOOL
+
+PM_REMOVE = 0x0001
+
+MsgWaitForMultipleObjects = user32.MsgWaitForMultipleObjects  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-msgwaitformultipleobjects
+MsgWaitForMultipleObjects.argtypes = [DWORD, POINTER(HANDLE), BOOL, DWORD, DWORD]
+MsgWaitForMultipleObjects.restype = DWORD
+
+INFINITE = 0xFFFFFFFF
+QS_ALLINPUT = 0x04FF
+WAIT_FAILED = 0xFFFFFFFF
+
 GetLastError = kernel32.GetLastError
 GetLastError.argtypes = []
 GetLastError.restype = DWORD
@@ -252,8 +291,9 @@ TranslateMessage = user32.TranslateMessage
 TranslateMessage.argtypes = [LPMSG]
 TranslateMessage.restype = BOOL
 
-DispatchMessage = user32.DispatchMessageA
+DispatchMessage = user32.DispatchMessageW  # W like PeekMessage and GetMessage
 DispatchMessage.argtypes = [LPMSG]
+DispatchMessage.restype = LRESULT
 
 keyboard_state_type = c_uint8 * 256
 
@@ -284,22 +324,63 @@ RIDI_DEVICENAME = 0x20000007
 RIDI_DEVICEINFO = 0x2000000b
 RIDI_PREPARSEDDATA = 0x20000005
 
-GetRawInputDeviceList = ctypes.windll.user32.GetRawInputDeviceList  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputdevicelist
+GetRawInputDeviceList = user32.GetRawInputDeviceList  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputdevicelist
 GetRawInputDeviceList.argtypes = [PRAWINPUTDEVICELIST, ctypes.POINTER(ctypes.c_uint), ctypes.c_uint]
 GetRawInputDeviceList.restype = ctypes.c_uint
 
-GetRawInputDeviceInfoW = ctypes.windll.user32.GetRawInputDeviceInfoW  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputdeviceinfoa
+GetRawInputDeviceInfoW = user32.GetRawInputDeviceInfoW  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputdeviceinfoa
 GetRawInputDeviceInfoW.argtypes = [HANDLE, DWORD, ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint)]
 GetRawInputDeviceInfoW.restype = ctypes.c_uint
 
+GetRawInputData = user32.GetRawInputData  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputdata
+GetRawInputData.argtypes = [HANDLE, UINT, LPVOID, POINTER(UINT), UINT]
+GetRawInputData.restype = UINT
+
+GetRawInputBuffer = user32.GetRawInputBuffer  # https://learn.microsoft.com/en-us/windows/win32/api/winuser/nf-winuser-getrawinputbuffer
+GetRawInputBuffer.argtypes = [LPVOID, POINTER(UINT), UINT]
+GetRawInputBuffer.restype = UINT
+
 CallWindowProc = user32.CallWindowProcA
 CallWindowProc.argtypes = [HANDLE, HWND, UINT, WPARAM, LPARAM]
+CallWindowProc.restype = LRESULT
 
 DefWindowProcA = user32.DefWindowProcA
 DefWindowProcA.argtypes = [HWND, UINT, WPARAM, LPARAM]
+DefWindowProcA.restype = LRESULT
+
+SetWindowLongPtrA = getattr(user32, 'SetWindowLongPtrA', None) or user32.SetWindowLongA  # only used to replace the window procedure, a macro for SetWindowLongA on 32 bit
+SetWindowLongPtrA.argtypes = [HWND, c_int, WNDPROCTYPE]
+SetWindowLongPtrA.restype = ctypes.c_void_p  # previous window procedure, pointer-sized
+
+IsWindow = user32.IsWindow
+IsWindow.argtypes = [HWND]
+IsWindow.restype = BOOL
+
+GetModuleHandleW = kernel32.GetModuleHandleW
+GetModuleHandleW.argtypes = [LPCWSTR]
+GetModuleHandleW.restype = HINSTANCE
+
+GetWindowThreadProcessId = user32.GetWindowThreadProcessId
+GetWindowThreadProcessId.argtypes = [HWND, POINTER(DWORD)]
+GetWindowThreadProcessId.restype = DWORD
+
+GetCurrentThreadId = kernel32.GetCurrentThreadId
+GetCurrentThreadId.argtypes = []
+GetCurrentThreadId.restype = DWORD
+
+GetCurrentProcess = kernel32.GetCurrentProcess
+GetCurrentProcess.argtypes = []
+GetCurrentProcess.restype = HANDLE
+
+IsWow64Process = kernel32.IsWow64Process
+IsWow64Process.argtypes = [HANDLE, POINTER(BOOL)]
+IsWow64Process.restype = BOOL
 
 NULL = c_int(0)
 
+WM_QUIT = 0x0012
+WM_NCDESTROY = 0x0082  # last message a window receives
+WM_INPUT_DEVICE_CHANGE = 0x00FE
 WM_INPUT = 0x00FF
 
 WM_KEYDOWN = 0x0100
@@ -653,6 +734,7 @@ canonical_names = {
 }
 
 
+@functools.lru_cache(maxsize=1024)
 def normalize_name(name):
     if not name:
         return 'unknown'
@@ -662,6 +744,10 @@ def normalize_name(name):
     return canonical_names.get(name, name)
 
 
+_NAME_BUFFER = ctypes.create_unicode_buffer(64)  # receives key names from GetKeyNameText and characters from ToUnicode
+_KEYBOARD_STATE = keyboard_state_type()  # only the shift key is ever set
+
+
 def _create_key_name_tables():
     """
     Build tables for scan codes.
@@ -670,7 +756,8 @@ def _create_key_name_tables():
         lower_case: `dict` mapping scan_code to lower-case key names
         upper_case: `dict` mapping scan code to upper-case key names
     """
-    key_names_by_scan_code = {}
+    lower_case = {}
+    upper_case = {}
     scan_code_to_vk = {}
 
     for vk in range(0x01, 0x100):
@@ -682,103 +769,197 @@ def _create_key_name_tables():
         if scan_code_to_vk.get(scan_code, 0) not in VIRTUAL_KEYBOARD:
             scan_code_to_vk[scan_code] = vk
 
-    name_buffer = ctypes.create_unicode_buffer(32)
-    keyboard_state = keyboard_state_type()
+    name_buffer = _NAME_BUFFER
+    keyboard_state = _KEYBOARD_STATE
+    ctypes.memset(keyboard_state, 0, sizeof(keyboard_state))
     for scan_code in range(2 ** (23 - 16)):
-        key_names_by_scan_code[scan_code] = ['unknown', 'unknown']
-
         # Get pure key name, such as "shift". This depends on locale and
         # may return a translated name.
-        for enhanced in [1, 0]:
-            ret = GetKeyNameText(scan_code << 16 | enhanced << 24, name_buffer, 1024)
-            if not ret:
-                continue
-            name = normalize_name(name_buffer.value)
-            key_names_by_scan_code[scan_code] = [name, name]
-
-        if scan_code not in scan_code_to_vk: continue
+        # The plain name is preferred, the enhanced (extended key) name is only queried if there is none.
+        name = 'unknown'
+        for enhanced in [0, 1]:
+            if GetKeyNameText(scan_code << 16 | enhanced << 24, name_buffer, len(name_buffer)):
+                name = normalize_name(name_buffer.value)
+                break
+        lower_case[scan_code] = upper_case[scan_code] = name
+
+        vk = scan_code_to_vk.get(scan_code)
+        if vk is None: continue
         # Get associated character, such as "^", possibly overwriting the pure key name.
-        for shift_state in [0, 1]:
+        for shift_state, names in [(0, lower_case), (1, upper_case)]:
             keyboard_state[0x10] = shift_state * 0xFF
-            vk = scan_code_to_vk.get(scan_code, 0)
-            ret = ToUnicode(vk, scan_code, keyboard_state, name_buffer, len(name_buffer), 0)
-            if ret:
+            if ToUnicode(vk, scan_code, keyboard_state, name_buffer, len(name_buffer), 0):
                 # Sometimes two characters are written before the char we want,
                 # usually an accented one such as Â. Couldn't figure out why.
-                char = name_buffer.value[-1]
-                key_names_by_scan_code[scan_code][shift_state] = char
+                names[scan_code] = name_buffer.value[-1]
 
-    key_names_by_scan_code[541] = ['alt gr', 'alt gr']
-    # key_names_by_vk_code = {vk: key_names_by_scan_code[scan_code] for scan_code, vk in scan_code_to_vk.items()}
-    return {c: lower for c, (lower, upper) in key_names_by_scan_code.items()}, {c: upper for c, (lower, upper) in key_names_by_scan_code.items()}
+    lower_case[541] = upper_case[541] = 'alt gr'
+    return lower_case, upper_case
 
 
 KEY_NAMES_LOWER, KEY_NAMES_UPPER = _create_key_name_tables()
 
-_REGISTERED_PROCEDURES_REFS = []  # do not garbage collect these
+# Parallel lists indexed by code, used when processing events. Unknown virtual keys have no name and fall back to the scan code.
+KEYBOARD_DEVICE_TYPES = ('keyboard', 'keypad')  # RawInputEvent.device_type indexed by is_keypad
+VIRTUAL_KEYBOARD_NAMES = [VIRTUAL_KEYBOARD[vk_code][0] if vk_code in VIRTUAL_KEYBOARD else None for vk_code in range(0x100)]
+VIRTUAL_KEYBOARD_DEVICE_TYPES = [KEYBOARD_DEVICE_TYPES[VIRTUAL_KEYBOARD[vk_code][1]] if vk_code in VIRTUAL_KEYBOARD else 'keyboard' for vk_code in range(0x100)]
+KEY_NAMES_LOWER_LIST = [KEY_NAMES_LOWER.get(scan_code, 'unknown') for scan_code in range(max(KEY_NAMES_LOWER) + 1)]
+
+_REGISTERED_PROCEDURES_REFS = {}  # hwnd -> window procedures, must not be garbage collected while the window exists
+_REGISTERED_WINDOW_CLASSES = []  # window classes are never unregistered, so their procedures are kept for the whole session
+
+
+def is_wow64() -> bool:
+    """Whether this is 32-bit Python running on 64-bit Windows. Raw input structures then have a different layout in `GetRawInputBuffer`."""
+    if sizeof(ctypes.c_void_p) == 8:
+        return False
+    wow64 = BOOL()
+    if not IsWow64Process(GetCurrentProcess(), byref(wow64)):
+        raise ctypes.WinError(GetLastError())
+    return bool(wow64.value)
 
 
-def set_window_procedure(hwnd, procedure: Callable, call_original=False):
+def _release_destroyed_windows():
+    """Drops the procedures of windows that have been destroyed. Windows no longer calls them."""
+    for hwnd in [hwnd for hwnd in _REGISTERED_PROCEDURES_REFS if not IsWindow(hwnd)]:
+        del _REGISTERED_PROCEDURES_REFS[hwnd]
+
+
+def set_window_procedure(hwnd, procedure: Callable, call_original=False, messages: Optional[Container[int]] = None):
+    """
+    Replaces the window procedure of `hwnd` so that `procedure(hwnd, msg, wParam, lParam)` is called for incoming messages.
+
+    Args:
+        hwnd: Window to subclass.
+        procedure: Function to call with the message arguments.
+        call_original: Whether to pass messages on to the previous window procedure instead of `DefWindowProcA`.
+        messages: If given, `procedure` is only called for these message types. Other messages are passed on directly.
+    """
     def process_message(hwnd, msg, wParam, lParam):
-        procedure(hwnd, msg, wParam, lParam)
-        if call_original:
-            return CallWindowProc(prevWndProc, hwnd, msg, wParam, lParam)
-        else:
-            return DefWindowProcA(hwnd, msg, wParam, lParam)
+        if messages is None or msg in messages:
+            procedure(hwnd, msg, wParam, lParam)
+        return pass_on(hwnd, msg, wParam, lParam)
 
+    pass_on = DefWindowProcA  # replaced by the previous window procedure below if call_original
     GWL_WNDPROC = ctypes.c_int(-4)
     new_window_procedure = WNDPROCTYPE(process_message)
-    _REGISTERED_PROCEDURES_REFS.append(new_window_procedure)
-    prevWndProc = user32.SetWindowLongPtrA(hwnd, GWL_WNDPROC, new_window_procedure)
+    _release_destroyed_windows()  # not from inside the procedures, a ctypes callback must not be freed while it runs
+    _REGISTERED_PROCEDURES_REFS.setdefault(hwnd, []).append(new_window_procedure)
+    prevWndProc = SetWindowLongPtrA(hwnd, GWL_WNDPROC, new_window_procedure)
     if not prevWndProc:
         raise ctypes.WinError(GetLastError())
+    if call_original:
+        pass_on = functools.partial(CallWindowProc, prevWndProc)
+
+
+_INVISIBLE_WINDOW_CLASS_NAME = 'Python Win32 Class'
+_INVISIBLE_WINDOW_PROCEDURES = {}  # hwnd -> (procedure, messages) of windows created by invisible_window()
 
 
-def invisible_window(procedure: Callable):
-    def actual_procedure(hwnd, msg, wParam, lParam):
-        procedure(hwnd, msg, wParam, lParam)
-        return user32.DefWindowProcA(c_int(hwnd), c_int(msg), c_int(wParam), c_int(lParam))
+def _invisible_window_procedure(hwnd, msg, wParam, lParam):
+    entry = _INVISIBLE_WINDOW_PROCEDURES.get(hwnd)  # None for the messages sent during CreateWindowExW
+    if entry is not None:
+        procedure, messages = entry
+        if messages is None or msg in messages:
+            procedure(hwnd, msg, wParam, lParam)
+        if msg == WM_NCDESTROY:
+            del _INVISIBLE_WINDOW_PROCEDURES[hwnd]
+    return DefWindowProcA(hwnd, msg, wParam, lParam)
 
-    h_instance = kernel32.GetModuleHandleW(0)
+
+def _register_invisible_window_class():
+    """Registers the window class shared by all windows from `invisible_window()` once per session."""
+    if _REGISTERED_WINDOW_CLASSES:
+        return
     window_class = WNDCLASSEX()
     window_class.cbSize = sizeof(WNDCLASSEX)
     window_class.style = CS_HREDRAW | CS_VREDRAW
-    window_class.lpfnWndProc = WNDPROCTYPE(actual_procedure)
+    window_class.lpfnWndProc = WNDPROCTYPE(_invisible_window_procedure)
     window_class.cbClsExtra = 0
     window_class.cbWndExtra = 0
-    window_class.hInstance = h_instance
+    window_class.hInstance = GetModuleHandleW(None)
     window_class.hIcon = 0
     window_class.hCursor = 0
-    window_class.hBrush = ctypes.windll.gdi32.GetStockObject(WHITE_BRUSH)
+    window_class.hBrush = GetStockObject(WHITE_BRUSH)
     window_class.lpszMenuName = 0
-    window_class.lpszClassName = 'Python Win32 Class'
+    window_class.lpszClassName = _INVISIBLE_WINDOW_CLASS_NAME
     window_class.hIconSm = 0
-    if not user32.RegisterClassExW(byref(window_class)):
+    if not RegisterClassExW(byref(window_class)):
         raise ctypes.WinError(GetLastError())
+    _REGISTERED_WINDOW_CLASSES.append(window_class)
+
+
+def invisible_window(procedure: Callable, messages: Optional[Container[int]] = None):
+    """
+    Creates a hidden window whose window procedure calls `procedure(hwnd, msg, wParam, lParam)`.
+    Each call creates a new window, all of them share one window class.
+
+    Args:
+        procedure: Function to call with the message arguments.
+        messages: If given, `procedure` is only called for these message types.
+
+    Returns:
+        Handle of the new window.
+    """
+    _register_invisible_window_class()
     h_window = CreateWindowExW(
         0,  # dwExStyle
-        window_class.lpszClassName,
+        _INVISIBLE_WINDOW_CLASS_NAME,
         'Invisible Window for Python Win32',
         0,  # dwStyle
         0, 0, 0, 0,  # x, y, nWidth, nHeight,
-        0, 0, h_instance, 0)
+        0, 0, GetModuleHandleW(None), 0)
     if not h_window:
         raise RuntimeError(f"Failed to create window: error code {GetLastError()}")
-    _REGISTERED_PROCEDURES_REFS.append(window_class)
+    _INVISIBLE_WINDOW_PROCEDURES[h_window] = (procedure, messages)
     return h_window
 
 
-def enable_raw_input_for_window(hwnd: int, device_type='Keyboard'):
-    usage_page, usage = USAGE_NAME_TO_VALUE[device_type.lower()]
-    raw_input_device = RAWINPUTDEVICE()
-    raw_input_device.us_usage_page = usage_page
-    raw_input_device.us_usage = usage
-    raw_input_device.dw_flags = RIDEV_INPUTSINK
-    raw_input_device.hwnd_target = hwnd  # 0 to follow the keyboard focus, else hWnd
-    if not RegisterRawInputDevices(raw_input_device, 1, sizeof(RAWINPUTDEVICE)):
+def enable_raw_input_for_window(hwnd: int, device_types: Sequence[str] = ('Keyboard',)):
+    """
+    Registers all `device_types` for raw input with a single call to `RegisterRawInputDevices`.
+
+    Args:
+        hwnd: Window to send the `WM_INPUT` messages to.
+        device_types: Names from `GENERIC_DESKTOP_CONTROLS_PAGE`, case-insensitive. A single `str` is also accepted.
+    """
+    if isinstance(device_types, str):
+        device_types = (device_types,)
+    raw_input_devices = (RAWINPUTDEVICE * len(device_types))()
+    for raw_input_device, device_type in zip(raw_input_devices, device_types):
+        usage_page, usage = USAGE_NAME_TO_VALUE[device_type.lower()]
+        raw_input_device.us_usage_page = usage_page
+        raw_input_device.us_usage = usage
+        raw_input_device.dw_flags = RIDEV_INPUTSINK | RIDEV_DEVNOTIFY
+        raw_input_device.hwnd_target = hwnd  # 0 to follow the keyboard focus, else hWnd
+    if not RegisterRawInputDevices(raw_input_devices, len(raw_input_devices), sizeof(RAWINPUTDEVICE)):
         raise ctypes.WinError(GetLastError())
 
 
+def pump_messages(block=True):
+    """
+    Dispatches the window messages of the calling thread, such as the `WM_INPUT` messages of an invisible window.
+
+    All queued messages are retrieved with `PeekMessage` before waiting for new ones with `MsgWaitForMultipleObjects`.
+
+    Args:
+        block: If `True`, keeps waiting for and dispatching messages until `WM_QUIT` is received.
+            If `False`, returns as soon as the queue is empty.
+    """
+    msg = MSG()
+    msg_ref = byref(msg)  # reused for all messages
+    while True:
+        while PeekMessage(msg_ref, None, 0, 0, PM_REMOVE):
+            if msg.message == WM_QUIT:
+                return
+            TranslateMessage(msg_ref)
+            DispatchMessage(msg_ref)
+        if not block:
+            return
+        if MsgWaitForMultipleObjects(0, None, False, INFINITE, QS_ALLINPUT) == WAIT_FAILED:
+            raise ctypes.WinError(GetLastError())
+
+
 MOUSE_BUTTONS = {
     1: ('down', 1, 'left'),
     2: ('up', 1, 'left'),
@@ -793,8 +974,33 @@ MOUSE_BUTTONS = {
     7865344: ('wheel-up', 2, 'wheel'),  # wheel turned
     4287104000: ('wheel-down', 2, 'wheel')  # wheel turned
 }
+MOUSE_BUTTON_FLAGS = [flag for flag in MOUSE_BUTTONS if flag < 0x400]  # single button transitions, in bit order
+MOUSE_BUTTONS_LIST = [MOUSE_BUTTONS.get(flags) for flags in range(0x400)]  # button flags only, wheel events include the wheel delta and stay in MOUSE_BUTTONS
+
+
+@functools.lru_cache(maxsize=256)
+def decode_button_flags(buttons: int) -> tuple:
+    """
+    Splits `RAWMOUSE.ulButtons` into its button transitions and wheel rotation.
+    This is only needed for values that are not in `MOUSE_BUTTONS`, i.e. multiple flags in one message or unusual wheel deltas.
+    Other flags, such as the horizontal wheel, are ignored.
+
+    Args:
+        buttons: `usButtonFlags` in the lower and `usButtonData` in the upper 16 bits.
+
+    Returns:
+        `tuple` of `(event_type, code, name)` in the order of the flag bits.
+    """
+    events = tuple(MOUSE_BUTTONS[flag] for flag in MOUSE_BUTTON_FLAGS if buttons & flag)
+    if buttons & 0x0400:  # RI_MOUSE_WHEEL, usButtonData holds the signed rotation
+        delta = buttons >> 16
+        if delta:
+            events += (('wheel-down', 2, 'wheel') if delta & 0x8000 else ('wheel-up', 2, 'wheel'),)
+    return events
 
-KEY_EVENT_TYPE = {256: 'down', 257: 'up', 260: 'down'}  # 260 for multi-key-down (alt gr)
+
+KEY_EVENT_TYPE = {256: 'down', 257: 'up', 260: 'down', 261: 'up'}  # 260/261 for system keys (alt, alt gr)
+KEY_EVENT_TYPE_LIST = tuple(KEY_EVENT_TYPE.get(message, 'unknown') for message in range(256, 262))  # indexed by message - 256
 
 MOUSE_TYPES = {
     0x0080: 'HID mouse',
@@ -809,6 +1015,7 @@ MOVE_MODES = {
     0x04: 'attributes changed',
     0x08: 'no coalesce',
 }
+MOVE_MODES_LIST = [MOVE_MODES.get(mode, 'unknown') for mode in range(0x10)]  # all combinations of the mode flags
 
 KEYBOARD_TYPES = {
     0x4: "Enhanced 101- or 102-key keyboards (and compatibles)",
@@ -827,6 +1034,16 @@ GENERIC_DESKTOP_CONTROLS_PAGE = {
     0x08:	"Multi-axis Controller"
 }
 USAGE_NAME_TO_VALUE = {v.lower(): (1, k) for k, v in GENERIC_DESKTOP_CONTROLS_PAGE.items()}
+# Raw input types (see RIM_TYPES) a device registered under each usage can report. Pointers and keypads may also be reported as HID.
+USAGE_NAME_TO_RAW_INPUT_TYPES = {
+    'pointer': (0, 2),
+    'mouse': (0,),
+    'joystick': (2,),
+    'game pad': (2,),
+    'keyboard': (1,),
+    'keypad': (1, 2),
+    'multi-axis controller': (2,),
+}
 
 USAGE_PAGE_NAMES = {
     0x01: ("Generic Desktop Controls", GENERIC_DESKTOP_CONTROLS_PAGE),
@@ -838,10 +1055,10 @@ USAGE_PAGE_NAMES = {
 
 def get_raw_input_device_list() -> ctypes.Array:
     device_count = ctypes.c_uint()
-    if GetRawInputDeviceList(None, device_count, ctypes.sizeof(RAWINPUTDEVICELIST)) == -1:
+    if GetRawInputDeviceList(None, device_count, ctypes.sizeof(RAWINPUTDEVICELIST)) == RAW_INPUT_ERROR:
         raise ctypes.WinError()
     devices = (RAWINPUTDEVICELIST * device_count.value)()
-    if GetRawInputDeviceList(devices, device_count, ctypes.sizeof(RAWINPUTDEVICELIST)) == -1:
+    if GetRawInputDeviceList(devices, device_count, ctypes.sizeof(RAWINPUTDEVICELIST)) == RAW_INPUT_ERROR:
         raise ctypes.WinError()
     return devices
 
@@ -857,17 +1074,53 @@ def get_device_path(device) -> Optional[str]:
     if device is None:
         return None
     device_handle = device.hDevice if isinstance(device, RAWINPUTDEVICELIST) else device
-    name_size = ctypes.c_uint()  # Get the size of the device name buffer
-    if GetRawInputDeviceInfoW(device_handle, RIDI_DEVICENAME, None, name_size):
-        raise ctypes.WinError(GetLastError())
-    name_buffer = (WCHAR * name_size.value)()
-    if not GetRawInputDeviceInfoW(device_handle, RIDI_DEVICENAME, name_buffer, name_size):
-        raise ctypes.WinError(GetLastError())
+    name_buffer = (WCHAR * 256)()  # Device paths usually fit, so the size is only queried if they don't
+    name_size = ctypes.c_uint(len(name_buffer))  # in characters
+    if GetRawInputDeviceInfoW(device_handle, RIDI_DEVICENAME, name_buffer, name_size) == RAW_INPUT_ERROR:
+        if name_size.value <= len(name_buffer):  # Windows writes the required size if the buffer is too small
+            raise ctypes.WinError(GetLastError())
+        name_buffer = (WCHAR * name_size.value)()
+        if GetRawInputDeviceInfoW(device_handle, RIDI_DEVICENAME, name_buffer, name_size) == RAW_INPUT_ERROR:
+            raise ctypes.WinError(GetLastError())
     return name_buffer.value
 
 
+_DEVICE_CONNECTED = {}  # hDevice -> bool, updated from WM_INPUT_DEVICE_CHANGE notifications
+_DEVICE_CHANGE_WINDOWS = set()  # hwnds whose notifications fed _DEVICE_CONNECTED
+
+
+def device_changed(wParam: int, lParam: int, hwnd):
+    """
+    Records a `WM_INPUT_DEVICE_CHANGE` message so that `is_connected()` does not need to query Windows for that device.
+    The recorded states are used until `device_window_destroyed()` has been called for all windows that received such a message.
+    They go stale if a window stops receiving these messages while it exists,
+    e.g. when its messages are not pumped or another `RegisterRawInputDevices` call in the process takes over the usage.
+
+    Args:
+        wParam: `GIDC_ARRIVAL` or `GIDC_REMOVAL`
+        lParam: hDevice
+        hwnd: Window that received the message.
+    """
+    _DEVICE_CHANGE_WINDOWS.add(hwnd)
+    _DEVICE_CONNECTED[lParam] = wParam == GIDC_ARRIVAL
+
+
+def device_window_destroyed(hwnd):
+    """
+    Records a `WM_NCDESTROY` message. The device states from `device_changed()` are forgotten once no window receives notifications anymore.
+
+    Args:
+        hwnd: Window that is being destroyed.
+    """
+    _DEVICE_CHANGE_WINDOWS.discard(hwnd)
+    if not _DEVICE_CHANGE_WINDOWS:
+        _DEVICE_CONNECTED.clear()
+
+
 def is_connected(device) -> bool:
     """
+    Uses the state recorded by `device_changed()` if available, else queries Windows.
+
     Args:
         device: RAWINPUTDEVICELIST or hDevice
 
@@ -875,6 +1128,9 @@ def is_connected(device) -> bool:
         Whether the device is currently available.
     """
     device_handle = device.hDevice if isinstance(device, RAWINPUTDEVICELIST) else device
+    connected = _DEVICE_CONNECTED.get(device_handle)
+    if connected is not None:  # known from a device change notification
+        return connected
     name_size = ctypes.c_uint()  # Get the size of the device name buffer
     ret = GetRawInputDeviceInfoW(device_handle, RIDI_DEVICENAME, None, name_size)
     if ret == 0:
@@ -896,10 +1152,9 @@ def get_device_info(device):
     if device is None:
         return RID_DEVICE_INFO()
     device_handle = device.hDevice if isinstance(device, RAWINPUTDEVICELIST) else device
-    info_size = ctypes.c_uint()
-    if GetRawInputDeviceInfoW(device_handle, RIDI_DEVICEINFO, None, info_size):
-        raise ctypes.WinError()
-    info_buffer = (RID_DEVICE_INFO * info_size.value)()
-    if not GetRawInputDeviceInfoW(device_handle, RIDI_DEVICEINFO, info_buffer, info_size):
+    info = RID_DEVICE_INFO()
+    info.cbSize = sizeof(RID_DEVICE_INFO)
+    info_size = ctypes.c_uint(sizeof(RID_DEVICE_INFO))  # the size is fixed, no need to query it
+    if GetRawInputDeviceInfoW(device_handle, RIDI_DEVICEINFO, byref(info), info_size) == RAW_INPUT_ERROR:
         raise ctypes.WinError()
-    return info_buffer[0]
+    return info